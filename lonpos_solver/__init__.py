@@ -1,9 +1,14 @@
-"""A Lonpos solver."""
+"""A Lonpos solver.
+
+Boards are int8 arrays holding 0 for empty cells, -1 for holes, and the
+(1-based) piece index for cells covered by a piece.
+"""
 
 import dataclasses
-from typing import Iterator, List, Optional, Tuple, Union
+import functools
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
 import numpy as np
-import matplotlib.pyplot as plt
+from lonpos_solver.bitboard import BitBoard, _read_only_cache
 
 
 @dataclasses.dataclass
@@ -36,36 +41,56 @@ def normalized_tuple(coords: np.ndarray) -> Tuple[Tuple[int, ...], ...]:
 
 
 def all_2d_rotations_and_translations(definition: List[Tuple[int, int]]
-    ) -> List[np.ndarray]:
-  """All possible displacements of a piece which contain (0, 0)."""
+    ) -> np.ndarray:
+  """All possible displacements of a piece which contain (0, 0), stacked."""
   rot90 = np.array([[0, -1], [1, 0]])
   flip = np.array([[-1, 0], [0, 1]])
-  xy = []
-  coords = np.array(definition)
-  for _ in range(2):
-    for _ in range(4):
-      for offset in coords:
-        xy.append(coords - offset)
-      coords = coords @ rot90
-    coords = coords @ flip
-  xy = set(normalized_tuple(p) for p in xy)  # de-dupe
-  return [np.array(p) for p in xy]
-
-
+  rotations = np.array([np.linalg.matrix_power(rot90, i) for i in range(4)])
+  symmetries = np.concatenate([rotations, flip @ rotations])
+  coords = np.einsum('kj,sji->ski', np.array(definition), symmetries)
+  # Move each cell of each rotated piece in turn to (0, 0).
+  xy = coords[:, None, :, :] - coords[:, :, None, :]
+  xy = xy.reshape(-1, *coords.shape[1:])
+  # Put the cells of each displacement in a canonical order, then de-dupe by
+  # viewing each one as a single opaque value.
+  order = np.lexsort((xy[..., 1], xy[..., 0]), axis=-1)
+  xy = np.take_along_axis(xy, order[..., None], axis=1)
+  rows = np.ascontiguousarray(xy.reshape(len(xy), -1))
+  rows = rows.view(np.dtype((np.void, rows.itemsize * rows.shape[1])))
+  _, keep = np.unique(rows, return_index=True)
+  return xy[np.sort(keep)]
+
+
+@functools.lru_cache(maxsize=None)
+def piece_orientations(definition: Tuple[Tuple[int, ...], ...],
+                       displacements=all_2d_rotations_and_translations
+                       ) -> Tuple[np.ndarray, ...]:
+  """The displacements of a piece, one read-only array per orientation.
+
+  Results are cached, so every solver shares the same arrays.
+  """
+  stacked = displacements(definition)
+  stacked.setflags(write=False)
+  return tuple(stacked)
+
+
+@_read_only_cache
 def rectangle_board() -> np.ndarray:
-  return np.zeros((11, 5), dtype='uint8')
+  return np.zeros((11, 5), dtype='int8')
 
 
+@_read_only_cache
 def triangle_board() -> np.ndarray:
-  board = np.zeros((10, 10), dtype='uint8')
+  board = np.zeros((10, 10), dtype='int8')
   for i in range(10):
     for j in range(9 - i):
       board[j, i] = -1
   return board
 
 
+@_read_only_cache
 def arrowhead_board() -> np.ndarray:
-  board = np.zeros((9, 9), dtype='uint8')
+  board = np.zeros((9, 9), dtype='int8')
   board[0, [0, 1, 2, 3, 6, 7, 8]] = -1
   board[[0, 1, 2, 3, 6, 7, 8], 0] = -1
   board[1, [1, 2, 3, 7, 8]] = -1
@@ -76,8 +101,9 @@ def arrowhead_board() -> np.ndarray:
   return board
 
 
+@_read_only_cache
 def butterfly_board() -> np.ndarray:
-  board = np.zeros((9, 9), dtype='uint8')
+  board = np.zeros((9, 9), dtype='int8')
   board[0, [0, 1, 2, 3, 8]] = -1
   board[1, [0, 1, 2, 3]] = -1
   board[2, [0, 1]] = -1
@@ -86,103 +112,197 @@ def butterfly_board() -> np.ndarray:
   return board
 
 
-class Lonpos2D:
-  """A Lonpos solver for 2D boards."""
+class LonposBase:
+  """The geometry-independent part of a Lonpos solver.
 
-  def __init__(self, board_type: Optional[str] = None):
-    self.piece = {i + 1: p for i, p in enumerate(PIECES)}
-    self.piece_idx = {p.name: i for i, p in self.piece.items()}
-    orientations = {}
-    for i, piece in self.piece.items():
-      coord_list = all_2d_rotations_and_translations(piece.definition)
-      orientations[i] = tuple(np.array(coords) for coords in coord_list)
-    self.orientations = orientations
+  Subclasses define _bitboard and symmetries for their board's geometry.
+  """
+  # The position is kept both as a board and as bitmasks, in sync.
+  # pylint: disable=too-many-instance-attributes
 
-    boards = {'triangle': triangle_board,
-              'arrowhead': arrowhead_board,
-              'butterfly': butterfly_board,
-              }
-    self.set_board(boards.get(board_type, rectangle_board)())
-    self.board_type = board_type
+  def __init__(self, pieces: Sequence[Piece], board: np.ndarray,
+               displacements=all_2d_rotations_and_translations):
+    self.piece = {i + 1: p for i, p in enumerate(pieces)}
+    self.piece_idx = {p.name: i for i, p in self.piece.items()}
+    self.orientations = {
+        i: piece_orientations(piece.definition, displacements)
+        for i, piece in self.piece.items()}
+    self.set_board(board)
 
-  def __repr__(self):
-    return f'Lonpos2D({self.board_type!r})'
+  def _bitboard(self, board: np.ndarray) -> BitBoard:
+    """The BitBoard for a board of this geometry."""
+    raise NotImplementedError
 
+  def symmetries(self) -> List[np.ndarray]:
+    """The non-trivial symmetries of the position, as permutations of the
+    board's cells."""
+    raise NotImplementedError
 
   def set_board(self, board: np.ndarray) -> None:
     """Sets a board position."""
-    self.board = board.copy()
-    used_indices = np.unique(board)
-    self.remaining_pieces = [p.name for i, p in self.piece.items()
-                                 if i not in used_indices]
+    # Older uint8 boards mark holes with 255, which wraps around to -1.
+    board = self.board = board.astype(np.int8)
+    present = np.bincount(board[board > 0], minlength=len(self.piece) + 1) > 0
+    self.remaining = sum(1 << i for i in self.piece if not present[i])
+    self.bitboard = self._bitboard(board)
+    self.piece_cells = {i: self.bitboard.mask(np.argwhere(board == i))
+                        for i in self.piece if present[i]}
+    # The mask of the filled cells, kept up to date as pieces come and go.
+    self.occupied = self.bitboard.occupied(board)
 
   def completed(self) -> bool:
     """True if the board is completed."""
-    return len(self.remaining_pieces) == 0 and (self.board != 0).all()
+    return self.remaining == 0 and self.occupied == self.bitboard.full
 
+  @property
+  def remaining_pieces(self) -> List[str]:
+    """The names of the pieces which aren't on the board."""
+    return [p.name for i, p in self.piece.items() if self.remaining >> i & 1]
 
-  def in_bounds(self, x: int, y: int) -> bool:
-    return 0 <= x < self.board.shape[0] and 0 <= y < self.board.shape[1]
 
+  def next_pos(self) -> Optional[Tuple[int, ...]]:
+    """A good candidate position on the board to try to fill, or None if the
+    board is full or has an empty spot which no remaining piece can cover."""
+    # An empty spot with at most bitboard.good_enough empty neighbors if
+    # possible. Otherwise, of those with the fewest empty neighbors, the one the
+    # fewest placements fit.
+    cell = self.bitboard.next_cell(self.occupied, self.remaining)
+    if cell is None:
+      return None
+    return tuple(int(c) for c in self.bitboard.cells[cell])
 
-  def next_pos(self) -> Tuple[int, int]:
-    """A good candidate position on the board to try to fill."""
-    # Returns an empty spot with 1 neighbor if possible, 2 neighbors otherwise.
-    candidate = None
-    empty = [(x, y) for x in range(self.board.shape[0])
-                 for y in range(self.board.shape[1]) if not self.board[x, y]]
-    offsets = [(1, 0), (0, 1), (-1, 0), (0, -1)]
-    for p in empty:
-      nbrs = [(p[0] + i, p[1] + j) for i, j in offsets]
-      nbrs = [n for n in nbrs if self.in_bounds(n[0], n[1])]
-      num_neighbors = sum(n in empty for n in nbrs)
-      if num_neighbors in [0, 1]:
-        return p
-      if candidate is None and  num_neighbors == 2:
-        candidate = p
-    return candidate
 
+  def can_place(self, coords: np.ndarray) -> Union[bool, np.ndarray]:
+    """True if the cells are all empty board cells.
 
-  def can_place(self, xy: np.ndarray) -> bool:
-    return (all(self.in_bounds(x, y) for x, y in xy) and
-            not self.board[xy[:, 0], xy[:, 1]].any())
+    Also takes a stack of sets of cells (e.g. every orientation of a piece at
+    some position) and checks them all at once, giving a boolean array.
+    """
+    if coords.ndim > 2:
+      masks = self.bitboard.stacked_masks(coords)
+      return (masks != 0) & (masks & np.uint64(self.occupied) == 0)
+    mask = self.bitboard.mask(coords)
+    return (mask is not None and
+            not mask & self.occupied)
 
 
-  def _place(self, xy: np.ndarray, index: int) -> None:
-    self.board[xy[:, 0], xy[:, 1]] = index
+  def _place(self, mask: int, index: int) -> None:
+    self.bitboard.fill(self.board, mask, index)
 
 
-  def place(self, name: str, xy: np.ndarray) -> None:
+  def place(self, name: str, coords: np.ndarray) -> None:
     """Adds the given piece to the board at the given coordinates."""
-    assert name in self.remaining_pieces, f'piece {name} not available'
     index = self.piece_idx[name]
-    valid_xy = set(normalized_tuple(xy_) for xy_ in self.orientations[index])
-    assert normalized_tuple(xy - xy[0]) in valid_xy, (
-        f'Not a valid orientation of piece {name}:\n{xy}')
-    assert self.can_place(xy), f'cannot place at {xy}'
-    self._place(xy, self.piece_idx[name])
-    self.remaining_pieces.remove(name)
-
-
-  def get_xy(self, name):
+    assert self.remaining >> index & 1, f'piece {name} not available'
+    mask = self.bitboard.mask(coords)
+    assert mask is not None, f'cannot place at {coords}'
+    assert self.bitboard.is_placement(index, mask), (
+        f'Not a valid orientation of piece {name}:\n{coords}')
+    assert not mask & self.occupied, (
+        f'cannot place at {coords}')
+    self._place(mask, index)
+    self.piece_cells[index] = mask
+    self.occupied |= mask
+    self.remaining ^= 1 << index
+
+
+  def _get_coords(self, name: str) -> np.ndarray:
     """Returns the coordinates of a piece on the board."""
     index = self.piece_idx[name]
-    if not (self.board == index).any():
+    if index not in self.piece_cells:
       raise ValueError(f'{name} is not on the board')
-    x, y = (self.board == index).nonzero()
-    return np.array(list(zip(x, y)))
+    return self.bitboard.coords(self.piece_cells[index])
 
 
   def unplace(self, *names):
     """Removes the given pieces from the board."""
     for name in names:
-      xy = self.get_xy(name)
-      self._place(xy, 0)
-      self.remaining_pieces.append(name)
+      index = self.piece_idx[name]
+      if index not in self.piece_cells:
+        raise ValueError(f'{name} is not on the board')
+      self._place(self.piece_cells[index], 0)
+      self.occupied ^= self.piece_cells.pop(index)
+      self.remaining |= 1 << index
+
+
+  def solutions(self, up_to_symmetry: bool = False) -> Iterator[np.ndarray]:
+    """All solutions from the given position.
+
+    With up_to_symmetry, skips solutions which are images of ones already
+    found under the position's symmetries (mostly; a few symmetric twins can
+    still show up).
+    """
+    symmetries = self.symmetries() if up_to_symmetry else None
+    for batch in self.bitboard.solution_batches(self.occupied, self.remaining,
+                                                symmetries):
+      yield from self.bitboard.fill_batch(self.board, batch)
+
+  def solution_masks(self, up_to_symmetry: bool = False
+                     ) -> Iterator[Tuple[int, ...]]:
+    """Like solutions, but without building boards: each solution is the mask
+    (see BitBoard) of every piece on the board, by piece index."""
+    symmetries = self.symmetries() if up_to_symmetry else None
+    for batch in self.bitboard.solution_batches(self.occupied, self.remaining,
+                                                symmetries):
+      batch |= self.placed_masks()
+      yield from map(tuple, batch.tolist())
+
+  def placed_masks(self) -> np.ndarray:
+    """The mask of every piece on the board, by piece index."""
+    masks = np.zeros(len(self.piece) + 1, 'uint64')
+    for index, mask in self.piece_cells.items():
+      masks[index] = mask
+    return masks
+
+  def mask_to_board(self, piece_masks: Tuple[int, ...]) -> np.ndarray:
+    """The board with the given pieces (see solution_masks) on it."""
+    board = np.where(self.board < 0, self.board, 0).astype(self.board.dtype)
+    return self.bitboard.fill_batch(
+        board, np.array([piece_masks], dtype='uint64'))[0]
+
+  def solve(self) -> None:
+    """Sets the board to the next found solution."""
+    for index, mask in next(self.bitboard.solutions(self.occupied,
+                                                    self.remaining)):
+      self._place(mask, index)
+      self.piece_cells[index] = mask
+      self.occupied |= mask
+    self.remaining = 0
+
+
+class Lonpos2D(LonposBase):
+  """A Lonpos solver for 2D boards."""
+
+  def __init__(self, board_type: Optional[str] = None):
+    boards = {'triangle': triangle_board,
+              'arrowhead': arrowhead_board,
+              'butterfly': butterfly_board,
+              }
+    super().__init__(PIECES, boards.get(board_type, rectangle_board)())
+    self.board_type = board_type
+
+  def __repr__(self):
+    return f'Lonpos2D({self.board_type!r})'
+
+
+  def _bitboard(self, board: np.ndarray) -> BitBoard:
+    offsets = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+    return BitBoard(board, self.orientations, offsets, good_enough=1)
+
+
+  def in_bounds(self, x: int, y: int) -> bool:
+    return 0 <= x < self.board.shape[0] and 0 <= y < self.board.shape[1]
+
+
+  def get_xy(self, name):
+    """Returns the coordinates of a piece on the board."""
+    return self._get_coords(name)
 
 
   def plot(self, board: Optional[np.ndarray] = None, ax=None) -> None:
     """Displays the board."""
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+    from matplotlib.collections import PatchCollection  # pylint: disable=import-outside-toplevel
     if ax is None:
       ax = plt.gca()
     if board is None:
@@ -193,91 +313,81 @@ class Lonpos2D:
     ax.set_aspect('equal')
     ax.get_xaxis().set_visible(False)
     ax.get_yaxis().set_visible(False)
+    patches = []
     for x in range(board.shape[0]):
       for y in range(board.shape[1]):
         idx = board[x, y]
-        if idx == 255:
+        if idx < 0:
           pass
         elif idx:
           piece = self.piece[idx]
-          ax.add_patch(plt.Circle((x, y), 0.5, facecolor=piece.color,
-            edgecolor='black', clip_on=False))
+          patches.append(plt.Circle((x, y), 0.5, facecolor=piece.color,
+            edgecolor='black'))
           ax.text(x, y, piece.name, ha='center', va='center')
         else:
-          ax.add_patch(plt.Circle((x, y), 0.4, color='white', clip_on=False))
-
-
-  def solutions(self) -> Iterator[np.ndarray]:
-    """All solutions from the given position."""
-    if not self.remaining_pieces:
-      yield self.board.copy()
-    else:
-      pos = self.next_pos()
-      for name in self.remaining_pieces.copy():
-        index = self.piece_idx[name]
-        for xy in self.orientations[index]:
-          xy = xy + pos
-          if not self.can_place(xy):
-            continue
-          self._place(xy, index)
-          self.remaining_pieces.remove(name)
-          for solution in self.solutions():
-            yield solution
-          self._place(xy, 0)
-          self.remaining_pieces.append(name)
-
-  def solve(self) -> None:
-    """Sets the board to the next found solution."""
-    self.board = next(self.solutions())
-    self.remaining_pieces = []
+          patches.append(plt.Circle((x, y), 0.4, color='white'))
+    ax.add_collection(PatchCollection(patches, match_original=True,
+                                      clip_on=False))
+
+
+  def symmetries(self) -> List[np.ndarray]:
+    """The non-trivial symmetries of the position, as permutations of the
+    board's cells."""
+    def transform(board, transpose, k):
+      return np.rot90(board.T if transpose else board, k)
+    bit = self.bitboard.bit_index
+    symmetries = []
+    for transpose in [False, True]:
+      for k in range(4):
+        if not transpose and k == 0:
+          continue
+        board = transform(self.board, transpose, k)
+        if board.shape == self.board.shape and (board == self.board).all():
+          perm = np.zeros(len(self.bitboard.cells), dtype=int)
+          perm[transform(bit, transpose, k)[bit >= 0]] = bit[bit >= 0]
+          symmetries.append(perm)
+    return symmetries
 
 
 def all_3d_rotations_and_translations(definition: List[Tuple[int, int]]
-    ) -> List[np.ndarray]:
-  """All possible displacements of a piece which contain (0, 0, 0)."""
+    ) -> np.ndarray:
+  """All possible displacements of a piece which contain (0, 0, 0), stacked."""
   result_2d = all_2d_rotations_and_translations(definition)
   # Pieces are either horizontal, or in one of two vertical planes.
-  result = [xy @ np.array([[1, 0, 0], [0, 1, 0]]) for xy in result_2d]
-  result.extend([xy @ np.array([[0, -1, 1], [-1, 0, 1]]) for xy in result_2d])
-  result.extend([xy @ np.array([[0, 0, 1], [-1, -1, 1]]) for xy in result_2d])
-  return result
+  return np.concatenate([result_2d @ np.array([[1, 0, 0], [0, 1, 0]]),
+                         result_2d @ np.array([[0, -1, 1], [-1, 0, 1]]),
+                         result_2d @ np.array([[0, 0, 1], [-1, -1, 1]])])
 
 
+@_read_only_cache
 def pyramid_board():
-  board = np.zeros((5, 5, 5), dtype='uint8')
+  board = np.zeros((5, 5, 5), dtype='int8')
   for z in range(1, 5):
     board[-z:, :, z] = -1
     board[:, -z:, z] = -1
   return board
 
 
-class Lonpos3D:
+class Lonpos3D(LonposBase):
   """A Lonpos solver for the pyramid."""
 
   def __init__(self):
-    self.piece = {i + 1: p for i, p in enumerate(PIECES)}
-    self.piece_idx = {p.name: i for i, p in self.piece.items()}
-    orientations = {}
-    for i, piece in self.piece.items():
-      coord_list = all_3d_rotations_and_translations(piece.definition)
-      orientations[i] = tuple(np.array(coords) for coords in coord_list)
-    self.orientations = orientations
-    self.set_board(pyramid_board())
+    super().__init__(PIECES, pyramid_board(),
+                     all_3d_rotations_and_translations)
 
   def __repr__(self):
     return 'Lonpos3D()'
 
 
-  def set_board(self, board: np.ndarray) -> None:
-    """Sets a board position."""
-    self.board = board.copy()
-    used_indices = np.unique(board)
-    self.remaining_pieces = [p.name for i, p in self.piece.items()
-                                 if i not in used_indices]
-
-  def completed(self) -> bool:
-    """True if the board is completed."""
-    return len(self.remaining_pieces) == 0 and (self.board != 0).all()
+  def _bitboard(self, board: np.ndarray) -> BitBoard:
+    offsets = [(1, 0, 0), (0, 1, 0), (-1, 0, 0), (0, -1, 0),
+               (-1, -1, 1), (-1, 0, 1), (0, -1, 1), (0, 0, 1),
+               (1, 1, -1), (1, 0, -1), (0, 1, -1), (0, 0, -1)]
+    # Cells are ordered top first.
+    cells = np.argwhere(board[:, :, ::-1] >= 0)
+    cells[:, 2] = board.shape[2] - 1 - cells[:, 2]
+    return BitBoard(board, self.orientations, offsets, good_enough=2,
+                    cells=cells)
 
 
   def in_bounds(self, x: int, y: int, z: int) -> bool:
@@ -286,67 +396,9 @@ class Lonpos3D:
             0 <= z < self.board.shape[2])
 
 
-  def next_pos(self) -> Tuple[int, int]:
-    """A good candidate position on the board to try to fill."""
-    # Returns an empty spot with few-ish empty neighbors.
-    candidate = None
-    candidate_neighbors = 12
-    empty = [(x, y, z) for x in range(self.board.shape[0])
-                 for y in range(self.board.shape[1])
-                 for z in reversed(range(self.board.shape[2]))  # top first
-                 if not self.board[x, y, z]]
-    offsets = [(1, 0, 0), (0, 1, 0), (-1, 0, 0), (0, -1, 0),
-               (-1, -1, 1), (-1, 0, 1), (0, -1, 1), (0, 0, 1),
-               (-1, -1, -1), (-1, 0, -1), (0, -1, -1), (0, 0, -1)]
-    for p in empty:
-      nbrs = [(p[0] + i, p[1] + j, p[2] + k) for i, j, k in offsets]
-      nbrs = [n for n in nbrs if self.in_bounds(n[0], n[1], n[2])]
-      num_neighbors = sum(n in empty for n in nbrs)
-      if num_neighbors in [0, 1, 2]:
-        # Good enough.
-        return p
-      if candidate is None or num_neighbors < candidate_neighbors:
-        candidate = p
-        candidate_neighbors = num_neighbors
-    return candidate
-
-
-  def can_place(self, xyz: np.ndarray) -> bool:
-    return (all(self.in_bounds(x, y, z) for x, y, z in xyz) and
-            not self.board[xyz[:, 0], xyz[:, 1], xyz[:, 2]].any())
-
-
-  def _place(self, xyz: np.ndarray, index: int) -> None:
-    self.board[xyz[:, 0], xyz[:, 1], xyz[:, 2]] = index
-
-
-  def place(self, name: str, xyz: np.ndarray) -> None:
-    """Adds the given piece to the board at the given coordinates."""
-    assert name in self.remaining_pieces, f'piece {name} not available'
-    index = self.piece_idx[name]
-    valid_xyz = set(normalized_tuple(xyz_) for xyz_ in self.orientations[index])
-    assert normalized_tuple(xyz - xyz[0]) in valid_xyz, (
-        f'Not a valid orientation of piece {name}:\n{xyz}')
-    assert self.can_place(xyz), f'cannot place at {xyz}'
-    self._place(xyz, self.piece_idx[name])
-    self.remaining_pieces.remove(name)
-
-
   def get_xyz(self, name):
     """Returns the coordinates of a piece on the board."""
-    index = self.piece_idx[name]
-    if not (self.board == index).any():
-      raise ValueError(f'{name} is not on the board')
-    x, y, z = (self.board == index).nonzero()
-    return np.array(list(zip(x, y, z)))
-
-
-  def unplace(self, *names):
-    """Removes the given pieces from the board."""
-    for name in names:
-      xyz = self.get_xyz(name)
-      self._place(xyz, 0)
-      self.remaining_pieces.append(name)
+    return self._get_coords(name)
 
 
   def drawn_position(self, x, y, z):
@@ -358,6 +410,8 @@ class Lonpos3D:
 
   def plot(self, board: Optional[np.ndarray] = None, ax=None) -> None:
     """Displays the board."""
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+    from matplotlib.collections import PatchCollection  # pylint: disable=import-outside-toplevel
     if board is None:
       board = self.board
     if ax is None:
@@ -367,41 +421,38 @@ class Lonpos3D:
     ax.set_ylim(-.6, self.drawn_position(0, 0, board.shape[2] - 1)[1] + .6)
     ax.set_aspect('equal')
     ax.axis('off')
+    patches = []
     for z in range(board.shape[2]):
       for y in reversed(range(board.shape[1])):  # draw back bubbles first
         for x in range(board.shape[0]):
           idx = board[x, y, z]
           xx, yy = self.drawn_position(x, y, z)
-          if idx == 255:
+          if idx < 0:
             pass
           elif idx:
             piece = self.piece[idx]
-            ax.add_patch(plt.Circle((xx, yy), 0.5, facecolor=piece.color,
-                edgecolor='black', clip_on=False))
+            patches.append(plt.Circle((xx, yy), 0.5, facecolor=piece.color,
+                edgecolor='black'))
             ax.text(xx, yy, piece.name, ha='center', va='center')
           else:
-            ax.add_patch(plt.Circle((xx, yy), 0.3, color='lightgray',
-                clip_on=False))
-
-
-  def solutions(self) -> Iterator[np.ndarray]:
-    """All solutions from the given position."""
-    if not self.remaining_pieces:
-      yield self.board.copy()
-    else:
-      pos = self.next_pos()
-      for name in self.remaining_pieces.copy():
-        index = self.piece_idx[name]
-        for xyz in self.orientations[index]:
-          xyz = xyz + pos
-          if not self.can_place(xyz):
-            continue
-          self._place(xyz, index)
-          self.remaining_pieces.remove(name)
-          for solution in self.solutions():
-            yield solution
-          self._place(xyz, 0)
-          self.remaining_pieces.append(name)
+            patches.append(plt.Circle((xx, yy), 0.3, color='lightgray'))
+    ax.add_collection(PatchCollection(patches, match_original=True,
+                                      clip_on=False))
+
+
+  def symmetries(self) -> List[np.ndarray]:
+    """The non-trivial symmetries of the position, as permutations of the
+    board's cells."""
+    # Swapping x and y maps the pyramid, the neighbor offsets and the planes
+    # that pieces lie in to themselves.
+    bit = self.bitboard.bit_index
+    def transform(board):
+      return board.transpose(1, 0, 2)
+    if (transform(self.board) != self.board).any():
+      return []
+    perm = np.zeros(len(self.bitboard.cells), dtype=int)
+    perm[transform(bit)[bit >= 0]] = bit[bit >= 0]
+    return [perm]
 
 
 ################################################################################
@@ -416,6 +467,7 @@ def calendar_pieces():
   ]
   return pieces
 
+@_read_only_cache
 def calendar_board_text():
   txt = np.concatenate(
     [np.array([['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', ''],
@@ -425,25 +477,24 @@ def calendar_board_text():
   txt = np.rot90(txt, -1)
   return txt
 
+@_read_only_cache
 def calendar_board(month, day):
   month = str(month)
   month = month[0].upper() + month[1:3]
   txt = calendar_board_text()
-  board = np.zeros(txt.shape, dtype='uint8')
+  board = np.zeros(txt.shape, dtype='int8')
   board = np.where(txt == '', -1, board)
   board = np.where(txt == month, -1, board)
   board = np.where(txt == str(day), -1, board)
-  return board.astype('uint8')
+  return board.astype('int8')
 
 class Calendar(Lonpos2D):
   def __init__(self, month, day):
     self.piece = {i + 1: p for i, p in enumerate(calendar_pieces())}
     self.piece_idx = {p.name: i for i, p in self.piece.items()}
-    orientations = {}
-    for i, piece in self.piece.items():
-      coord_list = all_2d_rotations_and_translations(piece.definition)
-      orientations[i] = tuple(np.array(coords) for coords in coord_list)
-    self.orientations = orientations
+    self.orientations = {
+        i: piece_orientations(piece.definition)
+        for i, piece in self.piece.items()}
     self.set_board(calendar_board(month, day))
     self.board_text = calendar_board_text()
     self.month = month
@@ -454,6 +505,8 @@ class Calendar(Lonpos2D):
 
   def plot(self, board: Optional[np.ndarray] = None, ax=None) -> None:
     """Displays the board."""
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+    from matplotlib.collections import PatchCollection  # pylint: disable=import-outside-toplevel
     if ax is None:
       ax = plt.gca()
     if board is None:
@@ -464,18 +517,21 @@ class Calendar(Lonpos2D):
     ax.set_aspect('equal')
     ax.get_xaxis().set_visible(False)
     ax.get_yaxis().set_visible(False)
+    patches = []
     for x in range(board.shape[0]):
       for y in range(board.shape[1]):
         idx = board[x, y]
-        if idx == 255:
+        if idx < 0:
           text = self.board_text[x, y]
           if text:
             ax.text(x, y, self.board_text[x, y], ha='center', va='center')
           else:
-            ax.add_patch(plt.Rectangle((x-.4, y-.4), .8, .8, color='white',
-                clip_on=False))
+            patches.append(plt.Rectangle((x-.4, y-.4), .8, .8, color='white',
+                linewidth=0))
         elif idx:
           piece = self.piece[idx]
-          ax.add_patch(plt.Rectangle((x-.5, y-.5), 1, 1, facecolor=piece.color,
-              clip_on=False))
+          patches.append(plt.Rectangle((x-.5, y-.5), 1, 1,
+              facecolor=piece.color, linewidth=0))
           ax.text(x, y, piece.name, ha='center', va='center', c='grey')
+    ax.add_collection(PatchCollection(patches, match_original=True,
+                                      clip_on=False))
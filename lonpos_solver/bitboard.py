@@ -0,0 +1,474 @@
+"""A board as bits of a uint64, and the numba kernels which search it.
+
+The kernels get the board's tables (neighbor masks, placements, and so on) as
+separate array arguments, which is what numba compiles best, so they disable
+pylint's limits on arguments and locals.
+"""
+
+import functools
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+import numba
+import numpy as np
+
+
+def _read_only_cache(f):
+  """Caches a function returning an array, and makes the array read-only so
+  that every caller can safely share it.
+
+  piece_orientations doesn't use this since it returns a tuple of views; it
+  makes the array they view read-only itself.
+  """
+  @functools.lru_cache(maxsize=None)
+  @functools.wraps(f)
+  def wrapper(*args):
+    result = f(*args)
+    result.setflags(write=False)
+    return result
+  return wrapper
+
+
+@numba.njit(cache=True)
+def _popcount(x):
+  """The number of set bits of a uint64."""
+  # Count bits in pairs, then nibbles, then add up the bytes.
+  x -= (x >> np.uint64(1)) & np.uint64(0x5555555555555555)
+  x = ((x & np.uint64(0x3333333333333333)) +
+       ((x >> np.uint64(2)) & np.uint64(0x3333333333333333)))
+  x = (x + (x >> np.uint64(4))) & np.uint64(0x0f0f0f0f0f0f0f0f)
+  return np.int64((x * np.uint64(0x0101010101010101)) >> np.uint64(56))
+
+
+@numba.njit(cache=True)
+def _lowest_bit(x):
+  """The index of the lowest set bit of a nonzero uint64."""
+  return _popcount(~x & (x - np.uint64(1)))
+
+
+@numba.njit(cache=True)
+def _num_fits(occupied, remaining, cell, masks, counts, limit):
+  """The number of placements of the remaining pieces which cover the cell,
+  counting no further than `limit`."""
+  # pylint: disable=too-many-arguments,too-many-positional-arguments
+  # As in _search, placements reaching below the first empty cell overlap.
+  below = (~occupied & (occupied + np.uint64(1))) - np.uint64(1)
+  fits = 0
+  for piece in range(masks.shape[0]):
+    if remaining >> piece & 1:
+      for k in range(counts[piece, cell]):
+        candidate = masks[piece, cell, k]
+        if candidate & below:
+          break
+        if not occupied & candidate:
+          fits += 1
+      if fits >= limit:
+        break
+  return fits
+
+
+@numba.njit(cache=True)
+def _next_cell(occupied, remaining, full, neighbor_mask, good_enough, masks,
+               counts):
+  """The first empty cell with at most `good_enough` empty neighbors if there
+  is one, otherwise, of the ones with as few empty neighbors as possible, the
+  one which the fewest placements of the remaining pieces fit. Returns -1 if
+  the board is full or one of those can't be covered at all."""
+  # pylint: disable=too-many-arguments,too-many-positional-arguments
+  # pylint: disable=too-many-locals
+  empty = full & ~occupied
+  tied = np.uint64(0)
+  fewest_neighbors = 0
+  todo = empty
+  while todo:
+    low = todo & ~(todo - np.uint64(1))
+    todo ^= low
+    cell = _lowest_bit(low)
+    num_neighbors = _popcount(neighbor_mask[cell] & empty)
+    if num_neighbors <= good_enough:
+      return cell
+    if not tied or num_neighbors < fewest_neighbors:
+      tied = low
+      fewest_neighbors = num_neighbors
+    elif num_neighbors == fewest_neighbors:
+      tied |= low
+  # Break ties by failing first: branch on the most constrained cell. Once a
+  # forced cell (with a single fit) turns up, the rest are only checked for
+  # having no fits at all, which is cheap since counting stops at the limit.
+  candidate = -1
+  candidate_fits = 1 << 30
+  while tied:
+    cell = _lowest_bit(tied)
+    tied &= tied - np.uint64(1)
+    fits = _num_fits(occupied, remaining, cell, masks, counts, candidate_fits)
+    if fits == 0:
+      return -1
+    if fits < candidate_fits:
+      candidate = cell
+      candidate_fits = fits
+  return candidate
+
+
+@numba.njit(cache=True)
+def _dead_end(occupied, remaining, mask, full, neighbor_mask, fillable):
+  """True if placing `mask` cut off a small region of empty cells whose size no
+  subset of the remaining pieces adds up to."""
+  # pylint: disable=too-many-arguments,too-many-positional-arguments
+  empty = full & ~occupied
+  # Only regions touching the new piece can have changed.
+  todo = np.uint64(0)
+  cells = mask
+  while cells:
+    todo |= neighbor_mask[_lowest_bit(cells)]
+    cells &= cells - np.uint64(1)
+  todo &= empty
+  while todo:
+    region = todo & ~(todo - np.uint64(1))
+    frontier = region
+    size = 0
+    # Regions too big for the fillable table are assumed to be fine, which
+    # saves flood filling most of the board at every step.
+    while frontier and size < fillable.shape[1]:
+      cell = _lowest_bit(frontier)
+      frontier &= frontier - np.uint64(1)
+      size += 1
+      new = neighbor_mask[cell] & empty & ~region
+      region |= new
+      frontier |= new
+    todo &= ~region
+    # So are regions with exactly as many cells as the table has columns.
+    if (not frontier and size < fillable.shape[1] and
+        not fillable[remaining, size]):
+      return True
+  return False
+
+
+@numba.njit(cache=True, inline='always')
+def _search(boards, state, depth, full, neighbor_mask, good_enough, masks,
+            counts, fillable, out):
+  """Depth first search for solutions, writing them to `out`.
+
+  The search state is kept in two stacks with a row per placed piece: `boards`
+  has the occupied mask and the mask of the piece placed there, and `state`
+  has the remaining pieces, the cell being filled, and the piece and placement
+  to try next. The search starts at row `depth` and stops when `out` is full,
+  so it can be resumed by calling it again with the returned depth; a depth of
+  -1 means it's done. Each solution is written as the masks of the placed
+  pieces.
+
+  Returns the new depth and the number of solutions written.
+  """
+  # pylint: disable=too-many-arguments,too-many-positional-arguments
+  # pylint: disable=too-many-locals
+  num_pieces = masks.shape[0]
+  found = 0
+  while depth >= 0 and found < len(out):
+    occupied = boards[depth, 0]
+    remaining = state[depth, 0]
+    cell = state[depth, 1]
+    piece = state[depth, 2]
+    k = state[depth, 3]
+    # Every cell below the first empty one is filled, so once placements reach
+    # down there (see BitBoard.masks) none of the rest fit either.
+    empty = full & ~occupied
+    below = (empty & ~(empty - np.uint64(1))) - np.uint64(1)
+    mask = np.uint64(0)
+    while piece < num_pieces:
+      if remaining >> piece & 1:
+        count = counts[piece, cell]
+        while k < count:
+          candidate = masks[piece, cell, k]
+          k += 1
+          if candidate & below:
+            break
+          if not occupied & candidate:
+            mask = candidate
+            break
+        if mask:
+          break
+      piece += 1
+      k = 0
+    state[depth, 2] = piece
+    state[depth, 3] = k
+    if not mask:
+      depth -= 1
+      continue
+    boards[depth, 1] = mask
+    remaining ^= 1 << piece
+    occupied |= mask
+    if not remaining:
+      out[found] = 0
+      for d in range(depth + 1):
+        out[found, state[d, 2]] = boards[d, 1]
+      found += 1
+      continue
+    if _dead_end(occupied, remaining, mask, full, neighbor_mask, fillable):
+      continue
+    cell = _next_cell(occupied, remaining, full, neighbor_mask, good_enough,
+                      masks, counts)
+    if cell < 0:
+      continue
+    depth += 1
+    boards[depth, 0] = occupied
+    state[depth, 0] = remaining
+    state[depth, 1] = cell
+    state[depth, 2] = 0
+    state[depth, 3] = 0
+  return depth, found
+
+
+# Long searches switch to a copy of the kernel compiled for their particular
+# tables once they have run for this many seconds.
+SPECIALIZE_AFTER = 5.0
+
+
+def _compile_specialized_search(full, neighbor_mask, good_enough, masks,
+                                counts, fillable):
+  """_search for fixed tables, as a function of (boards, state, depth, out).
+
+  The tables are compiled in as constants, which makes the search 10-15%
+  faster, but compiling takes a second or so and can't be cached on disk.
+  """
+  # pylint: disable=too-many-arguments,too-many-positional-arguments
+  @numba.njit
+  def search(boards, state, depth, out):
+    return _search(boards, state, depth, full, neighbor_mask, good_enough,
+                   masks, counts, fillable, out)
+  return search
+
+
+@_read_only_cache
+def fillable_table(sizes: Tuple[int, ...]) -> np.ndarray:
+  """Whether some pieces (as a bitset of indices into `sizes`) have sizes
+  adding up to a given size, for sizes below twice the largest piece."""
+  sums = [1]
+  for pieces in range(1, 1 << len(sizes)):
+    rest = pieces & (pieces - 1)
+    size = sizes[(pieces ^ rest).bit_length() - 1]
+    sums.append(sums[rest] | sums[rest] << size)
+  return np.array([[s >> size & 1 for size in range(2 * max(sizes))]
+                   for s in sums], dtype=bool)
+
+
+class BitBoard:
+  """The cells of a board as bits of an int, for fast search.
+
+  Every cell of the board which isn't a hole gets a bit, in the order given by
+  `cells`, so that any set of cells (a placed piece, the filled part of the
+  board) is a uint64 bitmask.
+  """
+  # Each table the kernels use is its own attribute, built all at once.
+  # pylint: disable=too-many-instance-attributes
+
+  def __init__(self, board: np.ndarray, orientations: Dict[int, np.ndarray],
+               offsets: List[Tuple[int, ...]], good_enough: int,
+               cells: Optional[np.ndarray] = None):
+    # pylint: disable=too-many-locals
+    if cells is None:
+      cells = np.argwhere(board >= 0)
+    if len(cells) > 64:
+      raise ValueError(f'boards have at most 64 cells, not {len(cells)}')
+    self.cells = cells
+    self.bit = {tuple(c): i for i, c in enumerate(cells.tolist())}
+    # bit_index[coords] is the bit of a cell, or -1 for holes.
+    self.bit_index = np.full(board.shape, -1)
+    self.bit_index[tuple(cells.T)] = np.arange(len(cells))
+    # flat_index[bit] is the position of the bit's cell in the flattened board.
+    self.flat_index = np.array(
+        np.ravel_multi_index(tuple(cells.T), board.shape), dtype=np.intp)
+    self.full = np.uint64((1 << len(cells)) - 1)
+    self.good_enough = good_enough
+    # neighbor_mask[cell] is the mask of the cell's neighbors.
+    nbrs = cells[:, None, None, :] + np.array(offsets)[None, :, None, :]
+    self.neighbor_mask = np.bitwise_or.reduce(self.stacked_masks(nbrs), axis=1)
+    # masks[index, cell, :counts[index, cell]] are the masks of all the ways to
+    # put the piece on the board covering the cell, sorted by their lowest
+    # cell, highest first.
+    num_pieces = max(orientations) + 1
+    placements = [np.zeros((len(cells), 0), 'uint64')] * num_pieces
+    for index in orientations:
+      xy = np.array(orientations[index])
+      masks = self.stacked_masks(cells[:, None, None, :] + xy[None])
+      # Test all orientations at every cell at once: masks which don't fit
+      # are 0, so they have no lowest cell and sort last.
+      lowest = np.frexp((masks & (~masks + np.uint64(1))).astype(float))[1]
+      order = np.argsort(-lowest, axis=-1, kind='stable')
+      placements[index] = np.take_along_axis(masks, order, axis=-1)
+    self.counts = np.array([(p != 0).sum(axis=-1) for p in placements])
+    self.masks = np.zeros(self.counts.shape + (self.counts.max(),), 'uint64')
+    for index, p in enumerate(placements):
+      width = min(p.shape[-1], self.masks.shape[-1])
+      self.masks[index, :, :width] = p[:, :width]
+    # fillable[remaining, size] says whether some of the remaining pieces (as
+    # a bitset) have sizes adding up to the given size, for small sizes.
+    self.fillable = fillable_table(tuple(
+        len(orientations[index][0]) if index in orientations else 0
+        for index in range(num_pieces)))
+    # Kernels specialized to this board's tables (see
+    # _compile_specialized_search).
+    self._specialized = {}
+
+  def mask(self, coords: np.ndarray) -> Optional[int]:
+    """The bitmask of the given cells, or None if some aren't on the board."""
+    mask = 0
+    for c in coords.tolist():
+      b = self.bit.get(tuple(c))
+      if b is None:
+        return None
+      mask |= 1 << b
+    return mask
+
+  def stacked_masks(self, coords: np.ndarray) -> np.ndarray:
+    """The bitmasks of stacked sets of cells (along the second to last axis of
+    the coordinates), or 0 for sets which aren't on the board."""
+    in_bounds = ((coords >= 0) & (coords < self.bit_index.shape)).all(axis=-1)
+    coords = np.where(in_bounds[..., None], coords, 0)
+    bits = np.where(in_bounds,
+                    self.bit_index[tuple(np.moveaxis(coords, -1, 0))], -1)
+    masks = np.bitwise_or.reduce(
+        np.uint64(1) << np.maximum(bits, 0).astype('uint64'), axis=-1)
+    return np.where((bits >= 0).all(axis=-1), masks, np.uint64(0))
+
+  def bits(self, mask: int) -> List[int]:
+    """The indices of the set bits of a bitmask."""
+    bits = []
+    while mask:
+      low = mask & -mask
+      bits.append(low.bit_length() - 1)
+      mask ^= low
+    return bits
+
+  def coords(self, mask: int) -> np.ndarray:
+    """The coordinates of the cells in a bitmask."""
+    return self.cells[self.bits(mask)]
+
+  def fill(self, board: np.ndarray, mask: int, value: int) -> None:
+    """Sets the cells of a bitmask on the board to the given value."""
+    bits = np.array(self.bits(mask), dtype=np.intp)
+    np.put(board, self.flat_index[bits], value)
+
+  def occupied(self, board: np.ndarray) -> int:
+    """The bitmask of the filled cells of a board."""
+    bits = self.bit_index.ravel()[np.flatnonzero(board)]
+    bits = bits[bits >= 0].astype('uint64')
+    return int(np.bitwise_or.reduce(np.uint64(1) << bits))
+
+  def placements(self, index: int, cell: int) -> np.ndarray:
+    """The masks of all the ways to put the piece on the board covering the
+    cell."""
+    return self.masks[index, cell, :self.counts[index, cell]]
+
+  def is_placement(self, index: int, mask: int) -> bool:
+    """True if the mask is one of the ways to put the piece on the board."""
+    return mask in self.placements(index, (mask & -mask).bit_length() - 1)
+
+  def next_cell(self, occupied: int, remaining: int) -> Optional[int]:
+    """A good candidate empty cell to fill with the remaining pieces."""
+    cell = _next_cell(np.uint64(occupied), remaining, self.full,
+                      self.neighbor_mask, self.good_enough, self.masks,
+                      self.counts)
+    return None if cell < 0 else cell
+
+  def permute(self, mask: int, perm: np.ndarray) -> int:
+    """The image of a mask under a permutation of the cells."""
+    return sum(1 << int(perm[b]) for b in range(len(perm)) if mask >> b & 1)
+
+  def break_symmetry(self, remaining: int, symmetries: List[np.ndarray]
+                     ) -> Tuple[np.ndarray, np.ndarray]:
+    """Placement tables which only allow one placement of some remaining piece
+    out of each set of placements related by the given symmetries.
+
+    Every solution is related to one which uses the allowed placements, so
+    searching with these tables finds every solution up to symmetry.
+    """
+    # The piece with the most placements is the least likely to have
+    # placements fixed by a symmetry, which would let some duplicates through.
+    indices = [i for i in range(len(self.masks)) if remaining >> i & 1]
+    index = max(indices, key=lambda i: self.counts[i].sum())
+    masks = self.masks.copy()
+    counts = self.counts.copy()
+    for cell in range(len(self.cells)):
+      allowed = [int(m) for m in self.placements(index, cell)
+                 if all(self.permute(int(m), perm) >= m for perm in symmetries)]
+      masks[index, cell] = 0
+      masks[index, cell, :len(allowed)] = allowed
+      counts[index, cell] = len(allowed)
+    return masks, counts
+
+  def solution_batches(self, occupied: int, remaining: int,
+                       symmetries: Optional[List[np.ndarray]] = None
+                       ) -> Iterator[np.ndarray]:
+    """All ways to fill the board with the remaining pieces (a bitset of piece
+    indices), in batches.
+
+    If symmetries of the position (as permutations of the cells) are given,
+    only finds solutions up to those symmetries. Each batch is a uint64 array
+    with a row per solution, holding the mask of each placed piece at its
+    index (and 0 for the other indices).
+    """
+    # The search state and tables are set up here for the kernel.
+    # pylint: disable=too-many-locals
+    if not remaining:
+      yield np.zeros((1, len(self.masks)), 'uint64')
+      return
+    cell = self.next_cell(occupied, remaining)
+    if cell is None:
+      return
+    masks, counts = self.masks, self.counts
+    if symmetries:
+      masks, counts = self.break_symmetry(remaining, symmetries)
+    boards = np.zeros((bin(remaining).count('1'), 2), 'uint64')
+    state = np.zeros((len(boards), 4), int)
+    boards[0, 0] = occupied
+    state[0, 0] = remaining
+    state[0, 1] = cell
+    def search(boards, state, depth, out):
+      return _search(boards, state, depth, self.full, self.neighbor_mask,
+                     self.good_enough, masks, counts, self.fillable, out)
+    specialized = False
+    elapsed = 0.0
+    depth = 0
+    batch = 1
+    while depth >= 0:
+      out = np.zeros((batch, len(self.masks)), 'uint64')
+      start = time.perf_counter()
+      depth, found = search(boards, state, depth, out)
+      elapsed += time.perf_counter() - start
+      if found:
+        yield out[:found]
+      # Start small, so that the first few solutions come quickly.
+      batch = min(2 * batch, 1024)
+      if not specialized and elapsed > SPECIALIZE_AFTER:
+        # The search state carries over, so just continue with the faster
+        # kernel.
+        search = self.specialized_search(masks, counts)
+        specialized = True
+
+  def specialized_search(self, masks: np.ndarray, counts: np.ndarray):
+    """_compile_specialized_search for this board and the given placement
+    tables, compiled once per set of tables."""
+    key = (masks.tobytes(), counts.tobytes())
+    if key not in self._specialized:
+      self._specialized[key] = _compile_specialized_search(
+          self.full, self.neighbor_mask, self.good_enough, masks, counts,
+          self.fillable)
+    return self._specialized[key]
+
+  def solutions(self, occupied: int, remaining: int,
+                symmetries: Optional[List[np.ndarray]] = None
+                ) -> Iterator[List[Tuple[int, int]]]:
+    """Like solution_batches, but each solution is a list of (piece index,
+    mask) pairs."""
+    for batch in self.solution_batches(occupied, remaining, symmetries):
+      for row in batch:
+        yield [(index, int(m)) for index, m in enumerate(row) if m]
+
+  def fill_batch(self, board: np.ndarray, batch: np.ndarray) -> np.ndarray:
+    """Copies of the board with the pieces of each row of a batch of solutions
+    (see solution_batches) filled in."""
+    bits = batch[:, :, None] >> np.arange(len(self.cells), dtype='uint64') & 1
+    values = np.einsum('spc,p->sc', bits.astype(board.dtype),
+                       np.arange(batch.shape[1], dtype=board.dtype))
+    boards = np.repeat(board[None], len(batch), axis=0)
+    flat = boards.reshape(len(batch), -1)
+    flat[:, self.flat_index] |= values
+    return boards
@@ -12,6 +12,7 @@ setup(
     packages=['lonpos_solver'],
     install_requires=[
         'matplotlib',
+        'numba',
         'numpy',
     ],
     python_requires='>=3.6',
@@ -1,5 +1,6 @@
 """An end-to-end test for lonpos_solver."""
 
+import numba
 import numpy as np
 import lonpos_solver
 
@@ -15,6 +16,69 @@ for board_type in ['rectangle', 'arrowhead', 'triangle', 'butterfly']:
   print(f'Found {NUM} solutions for {game}')
 
 
+# can_place also takes every orientation of a piece at once, which should
+# agree with checking them one at a time, on empty and partly filled boards
+# and at the edges.
+game = lonpos_solver.Lonpos2D()
+partial = lonpos_solver.Lonpos2D()
+partial.solve()
+partial.unplace('A', 'E', 'H', 'L')
+pyramid = lonpos_solver.Lonpos3D()
+pyramid.place('K', np.array(((0, 0, 0), (0, 1, 0), (1, 0, 0), (1, 1, 0))))
+num_checked = num_fits = 0
+for g, positions in [(game, [(0, 0), (5, 0), (5, 2), (10, 4)]),
+                     (partial, [(0, 0), (5, 0), (5, 2), (10, 4)]),
+                     (pyramid, [(0, 0, 0), (2, 4, 0), (1, 1, 1), (0, 0, 4)])]:
+  for name in ['A', 'E', 'K']:
+    orientations = np.array(g.orientations[g.piece_idx[name]])
+    for pos in positions:
+      stack = orientations + np.array(pos)
+      one_at_a_time = [g.can_place(xy) for xy in stack]
+      assert (g.can_place(stack) == one_at_a_time).all(), (
+          f'Stacked can_place disagrees for {name} at {pos} on {g}')
+      num_checked += len(stack)
+      num_fits += sum(one_at_a_time)
+assert 0 < num_fits < num_checked
+print(f'Checked can_place on {num_checked} placements, {num_fits} fit')
+
+
+# Filling the third column of the rectangle closes off a region of exactly
+# the size where the fillable table ends. That's too big to be a dead end, and
+# shouldn't read past the table either, so check with bounds checking on.
+game = lonpos_solver.Lonpos2D('rectangle')
+bitboard = game.bitboard
+column = np.uint64(bitboard.mask(np.array([(2, y) for y in range(5)])))
+assert bitboard.fillable.shape[1] == 2 * 5
+dead_end = lonpos_solver.bitboard._dead_end.py_func
+dead_end = numba.njit(boundscheck=True)(dead_end)
+assert not dead_end(column, game.remaining, column, bitboard.full,
+                    bitboard.neighbor_mask, bitboard.fillable), (
+    f'Found a dead end next to a 10 cell region for {game}')
+print(f'Found no dead end next to a 10 cell region for {game}')
+
+
+# The triangle board is symmetric under reflection, and no solution is, so
+# exactly half of the solutions are left up to symmetry.
+game = lonpos_solver.Lonpos2D('triangle')
+num_solns = sum(1 for _ in game.solutions())
+num_distinct = sum(1 for _ in game.solutions(up_to_symmetry=True))
+assert 2 * num_distinct == num_solns, (
+    f'Found {num_distinct} of {num_solns} solutions up to symmetry for {game}')
+print(f'Found {num_distinct} solutions up to symmetry for {game}')
+
+# The pyramid is symmetric under swapping x and y, and so is the K piece in a
+# corner of the bottom layer. Every solution should be a solution found up to
+# symmetry or its mirror image.
+game = lonpos_solver.Lonpos3D()
+game.place('K', np.array(((0, 0, 0), (0, 1, 0), (1, 0, 0), (1, 1, 0))))
+solns = {b.tobytes() for b in game.solutions()}
+distinct = list(game.solutions(up_to_symmetry=True))
+mirrored = {m.tobytes() for b in distinct for m in (b, b.transpose(1, 0, 2))}
+assert len(solns) == 70 and len(distinct) == 35 and mirrored == solns, (
+    f'Found {len(distinct)} of {len(solns)} solutions up to symmetry for {game}')
+print(f'Found {len(distinct)} solutions up to symmetry for {game}')
+
+
 # Finding a solution from scratch takes much longer for the 3D version, so
 # let's fill in a few pieces and check that we can find all the solutions.
 game = lonpos_solver.Lonpos3D()
@@ -25,6 +89,9 @@ game.place('F', np.array(((3, 2, 0), (4, 2, 0), (4, 3, 0))))
 game.place('K', np.array(((3, 0, 0), (3, 1, 0), (4, 0, 0), (4, 1, 0))))
 solns = list(game.solutions())
 assert len(solns) == 2, f'Failed to find 2 solutions for {game}.'
+for b, masks in zip(solns, game.solution_masks()):
+  assert (game.mask_to_board(masks) == b).all(), (
+      f'solution_masks and solutions disagree for {game}')
 print(f'Found 2 solutions for {game}, as expected.')
 
 
@@ -36,3 +103,22 @@ for b, i in zip(game.solutions(), range(NUM)):
 assert len(solns) == NUM, (
     f'Failed to find {NUM} solutions for {game}')
 print(f'Found {NUM} solutions for {game}')
+
+# Boards saved by older versions are uint8, with holes marked 255.
+game.set_board(lonpos_solver.calendar_board('Jun', 15).astype('uint8'))
+assert (next(game.solutions()) == solns[0]).all(), (
+    f'uint8 and int8 boards disagree for {game}')
+
+# Long searches switch to a kernel specialized to the board; make that happen
+# right away and check that it finds the same solutions in the same order.
+game = lonpos_solver.Calendar('Jun', 15)
+generic = list(game.solution_masks())
+specialize_after = lonpos_solver.bitboard.SPECIALIZE_AFTER
+lonpos_solver.bitboard.SPECIALIZE_AFTER = 0
+try:
+  specialized = list(game.solution_masks())
+finally:
+  lonpos_solver.bitboard.SPECIALIZE_AFTER = specialize_after
+assert specialized == generic, (
+    f'The specialized and generic searches disagree for {game}')
+print(f'Found {len(generic)} solutions for {game} with either search')